@@ -1,38 +1,127 @@
 import sys
 import os
 import re
+import hashlib
 import requests
-from io import BytesIO
-from pypdf import PdfReader
+import pymupdf
 from datetime import datetime
+from itertools import chain, islice
 
 # --- Configuration ---
 PDF_OUTPUT_DIR = "notifications"
+CACHE_DIR = os.path.join(PDF_OUTPUT_DIR, ".cache")
 
-def download_and_read_pdf(url):
-    """Downloads PDF content from a URL and extracts text from the first page."""
+# Shared session so repeated requests reuse the pooled keep-alive connection
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "gst-processor"})
+
+# Only the first ~4 KB of page text is scanned for the date and subject
+HEAD_SCAN_CHARS = 4096
+# How far above the date match to look for an ALL CAPS subject line
+SUBJECT_WINDOW_CHARS = 500
+
+# --- Precompiled Patterns ---
+# Both date shapes in one alternation so the text is scanned once:
+# "Dated: 31.10.2025" (group dmy) or "1st December, 2025" (groups day/mon/yr)
+DATE_PAT = re.compile(
+    r'(?:Dated|Date|No\.\s*)\s*[:\s]*(?P<dmy>\d{1,2}[./-]\d{1,2}[./-]\d{4})'
+    r'|(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+(?P<mon>January|February|March|April|May|June|July|August|September|October|November|December),\s+(?P<yr>\d{4})',
+    re.IGNORECASE)
+CLEAN_PAT = re.compile(r'[^\w\s-]')
+WS_PAT = re.compile(r'\s+')
+
+# Maps the '-' and '.' date separators to '/' in a single translate() pass
+DATE_SEP_TRANS = str.maketrans({'-': '/', '.': '/'})
+
+# Month name -> number, used instead of strptime('%B') for spelled-out dates
+MONTHS = {name.lower(): i for i, name in enumerate(["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"], 1)}
+
+def cache_path_for(url):
+    """Returns the download-cache path for a URL."""
+    return os.path.join(CACHE_DIR, f"{hashlib.sha256(url.encode()).hexdigest()}.pdf")
+
+def evict_cached_pdf(url):
+    """Removes a URL's cached copy so a bad download isn't reused on the next run."""
     try:
-        response = requests.get(url, stream=True)
+        os.remove(cache_path_for(url))
+    except OSError:
+        pass
+
+def download_pdf(url):
+    """
+    Returns the raw PDF bytes for a URL, served from the on-disk cache when this URL was fetched before.
+    """
+    cache_path = cache_path_for(url)
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            cached = f.read()
+        # Re-check every hit; anything that isn't a PDF is dropped and fetched again
+        if cached.startswith(b'%PDF-'):
+            print(f"Using cached copy: {cache_path}")
+            return cached
+        print(f"Warning: Discarding invalid cached copy: {cache_path}")
+        evict_cached_pdf(url)
+
+    try:
+        response = SESSION.get(url)
         response.raise_for_status() # Raise exception for bad status codes (4xx or 5xx)
-        
-        # Read content into a BytesIO object (in-memory file)
-        pdf_file = BytesIO(response.content)
-        
-        # Initialize PdfReader and extract text from the first page
-        reader = PdfReader(pdf_file)
-        if not reader.pages:
-            print("Error: PDF has no pages.")
-            return None
-            
-        first_page_text = reader.pages[0].extract_text()
-        return first_page_text
+        content = response.content
 
     except requests.exceptions.RequestException as e:
         print(f"Error downloading the PDF: {e}")
         return None
+
+    # Bail out on HTML error/landing pages before they reach the parser
+    ctype = response.headers.get('Content-Type', '').lower()
+    is_pdf = content.startswith(b'%PDF-')
+    if 'pdf' not in ctype and not is_pdf:
+        print(f"Error: URL did not return a PDF (Content-Type: {ctype or 'unknown'}).")
+        return None
+
+    # A PDF Content-Type is enough to try parsing, but only real %PDF- bytes are cached
+    if not is_pdf:
+        return content
+
+    # Write via a temp file + rename so a partial write is never mistaken for a cached PDF
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write download cache: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return content
+
+def download_and_read_pdf(url):
+    """
+    Downloads PDF content from a URL and extracts text from the first page.
+    Returns a (first_page_text, content) tuple so the bytes can be saved without a second download.
+    """
+    content = download_pdf(url)
+    if content is None:
+        return None
+
+    try:
+        # Open the PDF from memory with PyMuPDF and extract text from the first page only.
+        # Default text flags keep TEXT_CID_FOR_UNKNOWN_UNICODE, so unmapped (e.g. Devanagari) glyphs don't become U+FFFD.
+        with pymupdf.open(stream=content, filetype="pdf") as doc:
+            if doc.page_count == 0:
+                print("Error: PDF has no pages.")
+                evict_cached_pdf(url)
+                return None
+                
+            first_page_text = doc.load_page(0).get_text("text", flags=pymupdf.TEXTFLAGS_TEXT)
+        return first_page_text, content
+
     except Exception as e:
         print(f"Error reading the PDF content: {e}")
         # This might happen if the PDF is password protected or corrupted.
+        evict_cached_pdf(url)
         return None
 
 def parse_gst_details(text):
@@ -44,37 +133,59 @@ def parse_gst_details(text):
     
     print("Attempting automatic PDF parsing...")
     
-    # --- 1. Robust Date Extraction ---
-    date_pattern_1 = re.compile(r'(?:Dated|Date|No\.\s*)\s*[:\s]*(\d{1,2}[./-]\d{1,2}[./-]\d{4})', re.IGNORECASE)
-    date_pattern_2 = re.compile(r'(\d{1,2})(?:st|nd|rd|th)?\s+(January|February|March|April|May|June|July|August|September|October|November|December),\s+(\d{4})', re.IGNORECASE)
+    # Date and subject sit at the top of the page, so scan only the head first
+    # and fall back to the full text when the head yields nothing.
+    head = text[:HEAD_SCAN_CHARS]
+    truncated = len(text) > HEAD_SCAN_CHARS
+    # End of the last complete line in the head, so line-based steps never see a line cut off at the limit
+    cut = head.rfind('\n') + 1 if truncated else len(text)
     
-    date_match = date_pattern_1.search(text)
-    if date_match:
-        raw_date = date_match.group(1).strip()
-    else:
-        date_match_2 = date_pattern_2.search(text)
-        if date_match_2:
-            day, month_name, year = date_match_2.groups()
-            month_number = datetime.strptime(month_name, '%B').month
-            raw_date = f"{int(day):02d}/{month_number:02d}/{year}"
+    # --- 1. Robust Date Extraction ---
+    region_lines = []
+    for scope in ((head, text) if truncated else (head,)):
+        date_match = DATE_PAT.search(scope)
+        if date_match:
+            if date_match.group('dmy'):
+                raw_date = date_match.group('dmy').strip()
+            else:
+                day, month_name, year = date_match.group('day', 'mon', 'yr')
+                month_number = MONTHS[month_name.lower()]
+                raw_date = f"{int(day):02d}/{month_number:02d}/{year}"
+            # The subject sits just above the date, so keep that region for step 2
+            date_end = date_match.end()
+            region_start = max(0, date_end - SUBJECT_WINDOW_CHARS)
+            region_lines = scope[region_start:date_end].splitlines()
+            if region_start > 0 and scope[region_start - 1] != '\n':
+                region_lines = region_lines[1:] # Drop the line cut off by the slice
+            break
 
 
     # --- 2. Robust Subject/Purpose Extraction ---
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    region_lines = (line.strip() for line in region_lines if line.strip())
+    # The rest of the page is only split if the head runs out before 10 lines
+    lines = (line.strip() for part in (text[:cut], text[cut:]) for line in part.split('\n') if line.strip())
 
-    # 2a. Search for a line that is long and in ALL CAPS
-    for line in lines[:10]:
+    # 2a. Search for a line that is long and in ALL CAPS, first just above the date,
+    # then (only if that finds nothing) among the first 10 lines of the page
+    for line in chain(region_lines, islice(lines, 10)):
         if len(line) > 30 and line == line.upper() and 'GOVERNMENT' not in line:
             subject = line
             break
             
     # 2b. Fallback: Take the text immediately following the main header
     if subject == "Subject_Not_Found":
-        relevant_text = text.split("GOVERNMENT OF INDIA", 1)[-1] 
-        fallback_lines = [
-            line.strip() for line in relevant_text.split('\n') 
-            if line.strip() and len(line) > 10 and 'Notification No.' not in line
-        ][:3]
+        for scope in ((text[:cut], text) if truncated else (text,)):
+            before, header, after = scope.partition("GOVERNMENT OF INDIA")
+            relevant_text = after if header else before
+            # Lazily filter lines and stop as soon as three have been collected
+            fallback_lines = list(islice((
+                line.strip() for line in relevant_text.splitlines() 
+                if line.strip() and len(line) > 10 and 'Notification No.' not in line
+            ), 3))
+            # The head's answer only stands if it held the header (which may sit after a long
+            # Hindi block) and all three lines; otherwise retry on the full text
+            if header and len(fallback_lines) == 3:
+                break
         
         if fallback_lines:
              subject = " ".join(fallback_lines)
@@ -83,60 +194,63 @@ def parse_gst_details(text):
     # --- 3. Clean and Format Filename Components ---
     if subject != "Subject_Not_Found":
         # Clean up the subject for use in a filename
-        subject = re.sub(r'[^\w\s-]', '', subject).strip()
-        subject = re.sub(r'\s+', '_', subject)[:80].rstrip('_') 
+        subject = CLEAN_PAT.sub('', subject).strip()
+        subject = WS_PAT.sub('_', subject)[:80].rstrip('_') 
 
     return raw_date, subject
 
-def create_and_save_pdf(url, new_filename):
-    """Downloads the PDF and saves it with the new filename."""
+def create_and_save_pdf(content, new_filename):
+    """Saves the already-downloaded PDF bytes with the new filename."""
     try:
-        response = requests.get(url)
-        response.raise_for_status() 
-        
-        os.makedirs(PDF_OUTPUT_DIR, exist_ok=True)
         file_path = os.path.join(PDF_OUTPUT_DIR, new_filename)
         
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
+        # Write the whole blob with raw os.write calls, bypassing Python's buffered IO.
+        # os.write may write less than asked, so loop over a zero-copy view until done.
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(content)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
             
         print(f"::notice file={file_path}::Successfully saved as {new_filename}")
         print(f"File saved successfully as {file_path}")
         
-    except requests.exceptions.RequestException as e:
-        print(f"Error saving PDF (second download): {e}")
-        sys.exit(1)
     except Exception as e:
         print(f"An unexpected error occurred during file saving: {e}")
         sys.exit(1)
 
-# --- Main Execution Block ---
-if __name__ == "__main__":
-    # Script now expects 3 arguments: URL, Manual_Date, Manual_Subject
-    if len(sys.argv) < 2 or len(sys.argv) > 4:
-        print("Usage: python gst_processor.py <PDF_URL> [Manual_Date] [Manual_Subject]")
-        sys.exit(1)
+# --- Main Pipeline ---
+def main(pdf_url, manual_raw_date="", manual_subject=""):
+    """
+    Downloads, names and saves one notification PDF. Manual date/subject, when both given, skip parsing.
+    """
+    # Created once per run rather than per save; also creates PDF_OUTPUT_DIR
+    os.makedirs(CACHE_DIR, exist_ok=True)
 
-    pdf_url = sys.argv[1]
-    # Check if manual overrides were provided (they will be empty strings if not set in Action)
-    manual_raw_date = sys.argv[2] if len(sys.argv) > 2 else ""
-    manual_subject = sys.argv[3] if len(sys.argv) > 3 else ""
-    
     print(f"Processing URL: {pdf_url}")
 
     raw_date = None
     subject = None
     pdf_text = None
+    pdf_content = None
     
     # 1. Manual Override Check
     if manual_raw_date and manual_subject:
         print("Using MANUAL inputs provided via GitHub Action.")
         raw_date = manual_raw_date
         subject = manual_subject
+        # No parsing needed, but the bytes are still required for saving
+        pdf_content = download_pdf(pdf_url)
+        if not pdf_content:
+            print("Error: Could not download PDF.")
+            sys.exit(1)
     else:
         # 2. Automated Parsing Attempt (if no manual input)
-        pdf_text = download_and_read_pdf(pdf_url)
-        if pdf_text:
+        result = download_and_read_pdf(pdf_url)
+        if result and result[0]:
+            pdf_text, pdf_content = result
             raw_date, subject = parse_gst_details(pdf_text)
         else:
             print("Error: Could not download or read PDF for automated parsing.")
@@ -153,19 +267,40 @@ if __name__ == "__main__":
     # Standardize the Date Format
     date_prefix = None
     try:
-        # Tries to parse DD/MM/YYYY and reformat to YYYY-MM-DD
-        date_obj = datetime.strptime(raw_date.replace('-', '/').replace('.', '/'), '%d/%m/%Y')
-        date_prefix = date_obj.strftime('%Y-%m-%d')
-    except ValueError:
+        # Splits DD/MM/YYYY (or - / . separators) and reformats to YYYY-MM-DD
+        parts = raw_date.strip().translate(DATE_SEP_TRANS).split('/')
+        # Plain ASCII digits only (int() would also take '_', '+', spaces and non-ASCII digits),
+        # with the same 1-2 / 1-2 / 4 digit widths strptime('%d/%m/%Y') enforced
+        if len(parts) != 3 or not all(p.isascii() and p.isdigit() for p in parts) \
+                or not (1 <= len(parts[0]) <= 2 and 1 <= len(parts[1]) <= 2 and len(parts[2]) == 4):
+            raise ValueError(raw_date)
+        day, month, year = int(parts[0]), int(parts[1]), int(parts[2])
+        datetime(year, month, day) # Rejects impossible dates like 31/02
+        date_prefix = f"{year:04d}-{month:02d}-{day:02d}"
+    except (ValueError, IndexError):
         print(f"Fatal Error: The date '{raw_date}' (manual or parsed) could not be standardized to DD/MM/YYYY.")
         sys.exit(1)
 
     # Clean the subject again, just in case the manual input was messy
-    clean_subject = re.sub(r'[^\w\s-]', '', subject).strip()
-    clean_subject = re.sub(r'\s+', '_', clean_subject)[:80].rstrip('_')
+    clean_subject = CLEAN_PAT.sub('', subject).strip()
+    clean_subject = WS_PAT.sub('_', clean_subject)[:80].rstrip('_')
     
     new_filename = f"{date_prefix}_{clean_subject}.pdf"
     print(f"Constructed filename: {new_filename}")
     
-    # Save the file using the original URL
-    create_and_save_pdf(pdf_url, new_filename)
+    # Save the bytes fetched above; no second download
+    create_and_save_pdf(pdf_content, new_filename)
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    # Script now expects 3 arguments: URL, Manual_Date, Manual_Subject
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        print("Usage: python gst_processor.py <PDF_URL> [Manual_Date] [Manual_Subject]")
+        sys.exit(1)
+
+    # Check if manual overrides were provided (they will be empty strings if not set in Action)
+    main(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else "",
+        sys.argv[3] if len(sys.argv) > 3 else "",
+    )